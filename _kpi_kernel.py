@@ -0,0 +1,29 @@
+"""
+numeric kernel for the mock KPI generator
+
+kept free of framework imports and strictly typed so the Docker build
+can AOT-compile it to a C extension with mypyc (see Dockerfile);
+the interpreted module is the fallback when no compiled build exists
+"""
+import math
+import zlib
+
+__all__ = ["seed_from_key", "pseudo_random", "trend"]
+
+_TRENDS: tuple = ("down", "flat", "up")
+
+
+def seed_from_key(site_id: str, period: str) -> int:
+    key = f"{site_id}:{period}"
+    return zlib.crc32(key.encode("utf-8")) & 0xFFFFFFFF
+
+
+def pseudo_random(seed: int, min_val: float, max_val: float) -> float:
+    x = math.sin(seed) * 10000
+    frac = x - math.floor(x)
+    return min_val + (max_val - min_val) * frac
+
+
+def trend(delta: float, threshold: float) -> str:
+    # branchless: (delta > t) - (delta < -t) is -1/0/+1, shifted to index
+    return _TRENDS[(delta > threshold) - (delta < -threshold) + 1]
@@ -1,44 +1,84 @@
-from fastapi import FastAPI, Body
-from pydantic import BaseModel, Field
-from typing import Literal, List, Dict, Any
-import math
-import hashlib
+from fastapi import FastAPI, Body, HTTPException, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Literal, List, Dict, Any, Tuple, Union
+from functools import lru_cache
+import os
+import sys
+
+import numpy as np
+import orjson
+
+from _kpi_kernel import pseudo_random as _pseudo_random
+from _kpi_kernel import seed_from_key as _seed_from_key
+from _kpi_kernel import trend as _trend
+
+__all__ = ["app"]
+
+_dumps = orjson.dumps
 
 app = FastAPI(
     title="Compass Sustainability & Waste API",
     description="Mock sustainability KPI API for Opal demo by Víctor Manuel Ontiveros",
     version="1.0.0",
+    # orjson is much faster than the default json encoder
+    default_response_class=ORJSONResponse,
 )
 
+# the registry and compare payloads are a few KB of very compressible JSON;
+# gzip them for clients that ask, skip tiny responses like /health
+app.add_middleware(GZipMiddleware, minimum_size=512)
+
+# opt-in profiling: start with PROFILING=1, then hit any endpoint with
+# ?profile=1 to get a pyinstrument HTML flamegraph instead of the response.
+# zero cost when the env var is unset (middleware never registered)
+if os.getenv("PROFILING") == "1":
+    from pyinstrument import Profiler
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        if request.query_params.get("profile"):
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+            await call_next(request)
+            profiler.stop()
+            return HTMLResponse(profiler.output_html())
+        return await call_next(request)
+
 # ----- models ----- #
 
 Period = Literal["current", "previous", "last_month", "last_quarter"]
+# interned so cache-key probes hit the pointer-identity fast path
+_PERIODS: tuple = tuple(sys.intern(p) for p in ("current", "previous", "last_month", "last_quarter"))
 
 
 class SiteInfo(BaseModel):
+    # sites are static data, freezing lets pydantic-core skip mutation checks
+    model_config = ConfigDict(frozen=True)
+
     site_id: str
     name: str
     region: str
     segment: str  # workplace / school / healthcare / senior / logistics
 
 
-MOCK_SITES: List[SiteInfo] = [
-    SiteInfo(site_id="helsinki-hq", name="Helsinki Headquarters", region="Uusimaa", segment="workplace"),
-    SiteInfo(site_id="espoo-campus", name="Espoo Campus Restaurant", region="Uusimaa", segment="school"),
-    SiteInfo(site_id="vantaa-logistics", name="Vantaa Logistics Canteen", region="Uusimaa", segment="workplace"),
-    SiteInfo(site_id="tampere-tech", name="Tampere Tech Park Kitchen", region="Pirkanmaa", segment="workplace"),
-    SiteInfo(site_id="turku-hospital", name="Turku Hospital Cafeteria", region="Varsinais-Suomi", segment="healthcare"),
-]
+# keyed by site_id so site lookups/validation are O(1) dict probes
+MOCK_SITES_BY_ID: Dict[str, SiteInfo] = {
+    sys.intern(s.site_id): s
+    for s in (
+        SiteInfo(site_id="helsinki-hq", name="Helsinki Headquarters", region="Uusimaa", segment="workplace"),
+        SiteInfo(site_id="espoo-campus", name="Espoo Campus Restaurant", region="Uusimaa", segment="school"),
+        SiteInfo(site_id="vantaa-logistics", name="Vantaa Logistics Canteen", region="Uusimaa", segment="workplace"),
+        SiteInfo(site_id="tampere-tech", name="Tampere Tech Park Kitchen", region="Pirkanmaa", segment="workplace"),
+        SiteInfo(site_id="turku-hospital", name="Turku Hospital Cafeteria", region="Varsinais-Suomi", segment="healthcare"),
+    )
+}
 
-def _extract_parameters(body: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    enables support for both:
-      - direct payload: {"site_id": "...", "period": "..."}
-      - opal payload: {"parameters": {"site_id": "...", "period": "..."}}
-    """
-    if isinstance(body, dict) and "parameters" in body and isinstance(body["parameters"], dict):
-        return body["parameters"]
-    return body
+MOCK_SITES: List[SiteInfo] = list(MOCK_SITES_BY_ID.values())
+
+# static list, so serialize once at import time (same trick as the registry)
+_SITES_BYTES: bytes = _dumps([s.model_dump(mode="json") for s in MOCK_SITES])
 
 class GetKpisRequest(BaseModel):
     site_id: str = Field(..., description="Identifier for the site/location")
@@ -65,6 +105,17 @@ class CompareKpisRequest(BaseModel):
     previous_period: Period = "previous"
 
 
+# opal tool calls wrap their arguments in a "parameters" object; modelling
+# the wrapper as a union member lets pydantic-core pick the right variant
+# in Rust instead of a Python-level dict probe per request
+class OpalWrappedGetKpis(BaseModel):
+    parameters: GetKpisRequest
+
+
+class OpalWrappedCompareKpis(BaseModel):
+    parameters: CompareKpisRequest
+
+
 class DeltaKpis(BaseModel):
     site_id: str
     current_period: Period
@@ -85,14 +136,11 @@ class DeltaKpis(BaseModel):
     vegetarian_trend: Literal["up", "down", "flat"]
 
 # ----- opal tool registry ----- #
-@app.get("/opal-tool-registry")
-async def opal_tool_registry() -> Dict[str, Any]:
-    """
-    discovery endpoint for Optimizely opal
-    returns tool manifest in opal's expected format
-    don't worry about this for now
-    """
-    return {
+
+# the manifest never changes, so serialize it once at import time
+# and serve the cached bytes instead of re-encoding per request
+_REGISTRY_BYTES: bytes = _dumps(
+    {
         "functions": [
             {
                 "name": "list_sites",
@@ -167,23 +215,39 @@ async def opal_tool_registry() -> Dict[str, Any]:
             }
         ]
     }
+)
+
+
+@app.get("/opal-tool-registry")
+async def opal_tool_registry() -> Response:
+    """
+    discovery endpoint for Optimizely opal
+    returns tool manifest in opal's expected format
+    don't worry about this for now
+    """
+    return Response(content=_REGISTRY_BYTES, media_type="application/json")
 
 
 # ----- utility: deterministic mock generator ----- #
 
-def _seed_from_site_and_period(site_id: str, period: str) -> int:
-    key = f"{site_id}:{period}"
-    h = hashlib.sha256(key.encode("utf-8")).hexdigest()
-    return int(h[:8], 16)
+# the KPI caches make repeat calls rare, but this keeps the cold path
+# cheap too (no string formatting/encoding/crc on repeated inputs, e.g.
+# if dynamic sites ever bypass the precomputed domain). the lru_cache
+# wrapper lives here so _kpi_kernel stays mypyc-compilable
+_seed_from_site_and_period = lru_cache(maxsize=64)(_seed_from_key)
 
 
-def _pseudo_random(seed: int, min_val: float, max_val: float) -> float:
-    x = math.sin(seed) * 10000
-    frac = x - math.floor(x)
-    return min_val + (max_val - min_val) * frac
+# the (site_id, period) domain is tiny (5 sites x 4 periods), so every
+# KPI row is precomputed at import time -- requests only do dict lookups
+_KPI_CACHE: Dict[Tuple[str, str], SiteKpis] = {}
 
 
 def generate_mock_kpis(site_id: str, period: Period) -> SiteKpis:
+    kpis = _KPI_CACHE.get((site_id, period))
+    if kpis is not None:
+        return kpis
+
+    # cold path for sites/periods outside the precomputed domain
     seed = _seed_from_site_and_period(site_id, period)
 
     meals_served = int(_pseudo_random(seed, 500.0, 5000.0))
@@ -198,7 +262,7 @@ def generate_mock_kpis(site_id: str, period: Period) -> SiteKpis:
     vegetarian_share_percent = round(_pseudo_random(seed + 3, 10.0, 70.0), 1)
     total_co2_kg = round(co2_per_meal_kg * meals_served, 1)
 
-    return SiteKpis(
+    kpis = SiteKpis(
         site_id=site_id,
         period=period,
         meals_served=meals_served,
@@ -208,67 +272,142 @@ def generate_mock_kpis(site_id: str, period: Period) -> SiteKpis:
         vegetarian_share_percent=vegetarian_share_percent,
         total_co2_kg=total_co2_kg,
     )
+    _KPI_CACHE[(site_id, period)] = kpis
+    return kpis
+
+
+def _warm_kpi_cache() -> None:
+    """
+    precomputes all 20 KPI rows in one vectorized numpy pass
+    (the four _pseudo_random calls are independent arithmetic,
+    so one np.sin over all seeds beats 20 scalar loops)
+    """
+    combos = [(s.site_id, p) for s in MOCK_SITES for p in _PERIODS]
+    seeds = np.array([_seed_from_site_and_period(s, p) for s, p in combos], dtype=np.float64)
+
+    def batch(offset: float, min_val: float, max_val: float) -> np.ndarray:
+        x = np.sin(seeds + offset) * 10000
+        frac = x - np.floor(x)
+        return min_val + (max_val - min_val) * frac
+
+    meals = batch(0, 500.0, 5000.0).astype(np.int64)
+    waste = np.round(batch(1, 50.0, 600.0), 1)
+    co2 = np.round(batch(2, 0.3, 2.5), 2)
+    veg = np.round(batch(3, 10.0, 70.0), 1)
+    waste_per_meal = np.round(waste * 1000 / meals, 1)
+    total_co2 = np.round(co2 * meals, 1)
+
+    for i, (site_id, period) in enumerate(combos):
+        _KPI_CACHE[(site_id, period)] = SiteKpis(
+            site_id=site_id,
+            period=period,
+            meals_served=int(meals[i]),
+            food_waste_kg=float(waste[i]),
+            food_waste_per_meal_g=float(waste_per_meal[i]),
+            co2_per_meal_kg=float(co2[i]),
+            vegetarian_share_percent=float(veg[i]),
+            total_co2_kg=float(total_co2[i]),
+        )
+
+
+_warm_kpi_cache()
+
+# plain-dict view of the same rows, so the hot endpoints can serialize
+# without touching Pydantic at all
+_KPI_DICT_CACHE: Dict[Tuple[str, str], Dict[str, Any]] = {
+    key: kpis.model_dump(mode="json") for key, kpis in _KPI_CACHE.items()
+}
+
+
+def _kpi_dict(site_id: str, period: Period) -> Dict[str, Any]:
+    cached = _KPI_DICT_CACHE.get((site_id, period))
+    if cached is not None:
+        return cached
+    kpi_dict = generate_mock_kpis(site_id, period).model_dump(mode="json")
+    _KPI_DICT_CACHE[(site_id, period)] = kpi_dict
+    return kpi_dict
+
+
+def _build_compare_dict(site_id: str, current_period: Period, previous_period: Period) -> Dict[str, Any]:
+    current = _kpi_dict(site_id, current_period)
+    previous = _kpi_dict(site_id, previous_period)
+
+    delta_waste = round(current["food_waste_per_meal_g"] - previous["food_waste_per_meal_g"], 1)
+    delta_co2 = round(current["co2_per_meal_kg"] - previous["co2_per_meal_kg"], 2)
+    delta_veg = round(current["vegetarian_share_percent"] - previous["vegetarian_share_percent"], 1)
+
+    # built as a plain dict (shape of DeltaKpis) -- no Pydantic on the hot path
+    return {
+        "site_id": site_id,
+        "current_period": current_period,
+        "previous_period": previous_period,
+        "current": current,
+        "previous": previous,
+        "delta_food_waste_per_meal_g": delta_waste,
+        "delta_co2_per_meal_kg": delta_co2,
+        "delta_vegetarian_share_percent": delta_veg,
+        "waste_trend": _trend(delta_waste, threshold=5.0),
+        "co2_trend": _trend(delta_co2, threshold=0.05),
+        "vegetarian_trend": _trend(delta_veg, threshold=2.0),
+    }
+
+
+# the /compare-kpis domain is finite too (5 sites x 4 x 4 periods), so all
+# 80 responses are serialized to bytes up front -- a valid compare request
+# is then one dict lookup plus a fixed-buffer write, same as /health
+_COMPARE_CACHE: Dict[Tuple[str, str, str], bytes] = {
+    (site_id, cp, pp): _dumps(_build_compare_dict(site_id, cp, pp))
+    for site_id in MOCK_SITES_BY_ID
+    for cp in _PERIODS
+    for pp in _PERIODS
+}
 
 
 # ----- routes ----- #
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
-@app.get("/sites", response_model=List[SiteInfo])
-@app.post("/sites", response_model=List[SiteInfo])
-def list_sites(body: Dict[str, Any] | None = Body(None)):
+@app.get("/sites", responses={200: {"model": List[SiteInfo]}})
+@app.post("/sites", responses={200: {"model": List[SiteInfo]}})
+async def list_sites(body: Dict[str, Any] | None = Body(None)):
     print("/sites called ✅")
     """
     returns sone mocked compass site locations
     for expanding the demo to multi-site workflows
     or showing how opal could look up available locations
     """
-    return MOCK_SITES
+    return Response(content=_SITES_BYTES, media_type="application/json")
 
 
-@app.post("/get-kpis", response_model=SiteKpis)
-def get_kpis(body: Dict[str, Any] = Body(...)):
+# responses= documents the schema without FastAPI re-validating the
+# return value (we just built the model ourselves, no need to pay twice)
+@app.post("/get-kpis", responses={200: {"model": SiteKpis}})
+async def get_kpis(body: Union[OpalWrappedGetKpis, GetKpisRequest] = Body(...)):
     print("/get-kpis called ✅")
-    params = _extract_parameters(body)
-    payload = GetKpisRequest(**params)  # validate
+    payload = body.parameters if isinstance(body, OpalWrappedGetKpis) else body
+    # intern so the cache probes compare by pointer identity
+    site_id = sys.intern(payload.site_id)
+    if site_id not in MOCK_SITES_BY_ID:
+        raise HTTPException(status_code=404, detail=f"unknown site_id '{site_id}'")
 
-    return generate_mock_kpis(payload.site_id, payload.period)
+    return ORJSONResponse(_kpi_dict(site_id, sys.intern(payload.period)))
 
 
-@app.post("/compare-kpis", response_model=DeltaKpis)
-def compare_kpis(body: Dict[str, Any] = Body(...)):
+@app.post("/compare-kpis", responses={200: {"model": DeltaKpis}})
+async def compare_kpis(body: Union[OpalWrappedCompareKpis, CompareKpisRequest] = Body(...)):
     print("/compare-kpis called ✅")
-    params = _extract_parameters(body)
-    payload = CompareKpisRequest(**params)  # Pydantic validation
-
-    current = generate_mock_kpis(payload.site_id, payload.current_period)
-    previous = generate_mock_kpis(payload.site_id, payload.previous_period)
-
-    def trend(delta: float, threshold: float = 0.1) -> str:
-        if delta > threshold:
-            return "up"
-        elif delta < -threshold:
-            return "down"
-        else:
-            return "flat"
-
-    delta_waste = round(current.food_waste_per_meal_g - previous.food_waste_per_meal_g, 1)
-    delta_co2 = round(current.co2_per_meal_kg - previous.co2_per_meal_kg, 2)
-    delta_veg = round(current.vegetarian_share_percent - previous.vegetarian_share_percent, 1)
-
-    return DeltaKpis(
-        site_id=payload.site_id,
-        current_period=payload.current_period,
-        previous_period=payload.previous_period,
-        current=current,
-        previous=previous,
-        delta_food_waste_per_meal_g=delta_waste,
-        delta_co2_per_meal_kg=delta_co2,
-        delta_vegetarian_share_percent=delta_veg,
-        waste_trend=trend(delta_waste, threshold=5.0),
-        co2_trend=trend(delta_co2, threshold=0.05),
-        vegetarian_trend=trend(delta_veg, threshold=2.0),
-    )
\ No newline at end of file
+    payload = body.parameters if isinstance(body, OpalWrappedCompareKpis) else body
+    site_id = sys.intern(payload.site_id)
+    if site_id not in MOCK_SITES_BY_ID:
+        raise HTTPException(status_code=404, detail=f"unknown site_id '{site_id}'")
+
+    key = (site_id, sys.intern(payload.current_period), sys.intern(payload.previous_period))
+    cached = _COMPARE_CACHE.get(key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    # cold path for combos outside the precomputed domain
+    return ORJSONResponse(_build_compare_dict(*key))
\ No newline at end of file
@@ -0,0 +1,20 @@
+"""
+production entrypoint
+uvloop + httptools, access log off, one worker per CPU
+(uvicorn[standard] ships both speedups, see requirements.txt)
+"""
+import os
+
+import uvicorn
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+        proxy_headers=False,
+        workers=os.cpu_count(),
+    )
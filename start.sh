@@ -5,8 +5,4 @@ PORT=${PORT:-8000}
 
 echo "listening on port $PORT..."
 
-uvicorn main:app \
-    --host 0.0.0.0 \
-    --port $PORT \
-    --proxy-headers \
-    --forwarded-allow-ips="*"
+exec python run.py